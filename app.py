@@ -12,39 +12,178 @@ STRATEGY_DESCRIPTIONS = {
     "Iron Condor": "<b>看法:</b> 盤整 (Neutral)<br><b>資金:</b> 收入權利金 (Credit)<br>同時賣出一個看跌的信用價差和一個看漲的信用價差，賭股價在寬廣的區間內波動。"
 }
 
+LEG_TYPE_MAP = {'long_call': '買進 買權', 'short_call': '賣出 買權', 'long_put': '買進 賣權', 'short_put': '賣出 賣權'}
 
-# --- 核心計算函式 (無變動) ---
-def calculate_payoff(S, strategy_details):
-    total_payoff_points = np.zeros_like(S, dtype=float)
-    for leg in strategy_details:
-        K, premium, direction, option_type = leg['strike'], leg['premium'], (1 if leg['type'].startswith('long') else -1), ('call' in leg['type'])
-        intrinsic_value = np.maximum(0, S - K) if option_type else np.maximum(0, K - S)
-        total_payoff_points += direction * intrinsic_value
-    return total_payoff_points
+# 股價網格點數固定，不隨履約價區間寬窄改變陣列大小
+N_GRID = 256
+
+
+# --- 核心計算函式 ---
+def legs_to_arrays(legs):
+    # 將 (type, strike, premium) 腳位轉為結構化陣列 (SoA)：履約價、權利金、方向 (+1 買 / -1 賣)、是否為買權
+    K = np.array([k for _, k, _ in legs])
+    P = np.array([p for _, _, p in legs])
+    D = np.array([1 if t.startswith('long') else -1 for t, _, _ in legs], dtype=np.int8)
+    C = np.array(['call' in t for t, _, _ in legs])
+    return K, P, D, C
+
+def calculate_payoff(S, K, D, C):
+    # 以廣播一次算出所有腳位的內含價值 (N x 腳位數)，再與方向向量內積，不逐腳迴圈
+    # 全程在同一個緩衝區就地運算，不為每個步驟配置暫存陣列；賣權腳位乘上 -1 取 K - S
+    sign = np.where(C, 1, -1).astype(S.dtype)
+    intrinsic_value = np.subtract.outer(S, K.astype(S.dtype))
+    intrinsic_value *= sign
+    np.maximum(intrinsic_value, 0, out=intrinsic_value)
+    return intrinsic_value @ D
 
 def find_break_even_points(S, PnL):
-    indices = np.where(np.diff(np.sign(PnL)))[0]
-    break_evens = [S[i] - PnL[i] * (S[i+1] - S[i]) / (PnL[i+1] - PnL[i]) for i in indices if PnL[i+1] - PnL[i] != 0]
-    return break_evens
-
-def calculate_us_margin(strategy_name, strategy_details, multiplier):
-    net_premium = sum([leg['premium'] if leg['type'].startswith('short') else -leg['premium'] for leg in strategy_details])
-    if net_premium <= 0: return 0
-    margin = 0
-    if strategy_name in ["Iron Condor", "Bull Put Spread", "Bear Call Spread"]:
-        k_values = [leg['strike'] for leg in strategy_details]
-        margin = (max(k_values) - min(k_values)) * multiplier
-        if strategy_name == "Iron Condor":
-            k_calls = sorted([leg['strike'] for leg in strategy_details if 'call' in leg['type']])
-            margin = (k_calls[1] - k_calls[0]) * multiplier
-    return margin
-
-# --- Streamlit UI 介面 (無變動) ---
+    # 以浮點數符號位元的 XOR 找出正負交界，單次比較即可，不需先算 sign 再 diff
+    sb = np.signbit(PnL)
+    indices = np.where(sb[:-1] ^ sb[1:])[0]
+    dS, dP = S[indices + 1] - S[indices], PnL[indices + 1] - PnL[indices]
+    mask = dP != 0
+    # 以整批陣列運算做線性內插，分母為 0 的位置先代入 1 再濾除
+    break_evens = (S[indices] - PnL[indices] * dS / np.where(mask, dP, 1))[mask]
+    return break_evens.tolist()
+
+# 各信用價差的保證金公式 (依 UI 建立腳位的固定順序以索引取履約價)，未列出者 (Debit 策略) 為 0
+MARGIN_FORMULAS = {
+    "Bull Put Spread": lambda K, multiplier, net_premium: (K[0] - K[1]) * multiplier,
+    "Bear Call Spread": lambda K, multiplier, net_premium: (K[1] - K[0]) * multiplier,
+    "Iron Condor": lambda K, multiplier, net_premium: (K[3] - K[2]) * multiplier,
+}
+
+# 各策略的最大獲利 / 最大虧損 (損益為分段線性，極值落在履約價或兩側平坦區)，回傳 (max_profit, max_loss)
+EXTREME_FORMULAS = {
+    "Bull Call Spread": lambda K, multiplier, net_premium: (((K[1] - K[0]) + net_premium) * multiplier, net_premium * multiplier),
+    "Bear Put Spread": lambda K, multiplier, net_premium: (((K[0] - K[1]) + net_premium) * multiplier, net_premium * multiplier),
+    "Bull Put Spread": lambda K, multiplier, net_premium: (net_premium * multiplier, (net_premium - (K[0] - K[1])) * multiplier),
+    "Bear Call Spread": lambda K, multiplier, net_premium: (net_premium * multiplier, (net_premium - (K[1] - K[0])) * multiplier),
+    "Butterfly Spread": lambda K, multiplier, net_premium: (((K[1] - K[0]) + net_premium) * multiplier, (net_premium + min(0, 2 * K[1] - K[0] - K[3])) * multiplier),
+    "Iron Condor": lambda K, multiplier, net_premium: (net_premium * multiplier, (net_premium - max(K[1] - K[0], K[3] - K[2])) * multiplier),
+}
+
+def _root_in(lo, hi, x):
+    # 損益在 [lo, hi] 區段內為斜率 ±1 的直線，零點落在區段內 (含端點) 才是損益兩平點
+    # 與端點僅差浮點誤差時對齊到端點，相鄰區段算出的共用履約價才會完全相同
+    if np.isclose(x, lo, rtol=1e-12, atol=0): x = lo
+    elif np.isclose(x, hi, rtol=1e-12, atol=0): x = hi
+    return [float(x)] if lo <= x <= hi else []
+
+# 各策略的損益兩平點 (各斜率區段的零點)
+BREAK_EVEN_FORMULAS = {
+    "Bull Call Spread": lambda K, net_premium: _root_in(K[0], K[1], K[0] - net_premium),
+    "Bear Put Spread": lambda K, net_premium: _root_in(K[1], K[0], K[0] + net_premium),
+    "Bull Put Spread": lambda K, net_premium: _root_in(K[1], K[0], K[0] - net_premium),
+    "Bear Call Spread": lambda K, net_premium: _root_in(K[0], K[1], K[0] + net_premium),
+    "Butterfly Spread": lambda K, net_premium: _root_in(K[0], K[1], K[0] - net_premium) + _root_in(K[1], K[3], 2 * K[1] - K[0] + net_premium),
+    "Iron Condor": lambda K, net_premium: _root_in(K[0], K[1], K[1] - net_premium) + _root_in(K[2], K[3], K[2] + net_premium),
+}
+
+def calculate_break_evens(strategy_name, K, net_premium, S, pnl_currency):
+    break_even_fn = BREAK_EVEN_FORMULAS.get(strategy_name)
+    if break_even_fn is None: return find_break_even_points(S, pnl_currency)
+    # 相鄰區段共用的履約價端點可能各算出一次，去除重複並保持順序
+    return list(dict.fromkeys(break_even_fn(K, net_premium)))
+
+def calculate_extremes(strategy_name, K, net_premium, multiplier, pnl_currency):
+    extremes_fn = EXTREME_FORMULAS.get(strategy_name)
+    if extremes_fn is None: return np.max(pnl_currency), np.min(pnl_currency)
+    return extremes_fn(K, multiplier, net_premium)
+
+def calculate_us_margin(strategy_name, K, net_premium, multiplier):
+    margin_fn = MARGIN_FORMULAS.get(strategy_name)
+    if net_premium <= 0 or margin_fn is None: return 0
+    return margin_fn(K, multiplier, net_premium)
+
+@st.cache_data(max_entries=64)
+def compute_all(strategy_name, legs, multiplier):
+    # legs 為 (type, strike, premium) 的 tuple，作為快取鍵；輸入不變時直接取用快取結果
+    K, P, D, C = legs_to_arrays(legs)
+    min_strike, max_strike = K.min(), K.max()
+    buffer = (max_strike - min_strike) * 1.5 if max_strike > min_strike else 20
+    # 價格與損益全程使用 float32：報價僅到小數兩位，float32 精度足夠且記憶體頻寬減半
+    # 履約價併入網格，確保損益轉折點都落在網格節點上；總點數仍固定為 N_GRID
+    S = np.sort(np.concatenate([
+        np.linspace(min_strike - buffer, max_strike + buffer, N_GRID - K.size, dtype=np.float32),
+        K.astype(np.float32),
+    ]))
+    net_premium_points = -(D * P).sum()
+    pnl_currency = calculate_payoff(S, K, D, C)
+    pnl_currency += net_premium_points
+    pnl_currency *= multiplier
+    # 獲利區 / 虧損區填色資料與損益一併在快取內算好，寫入預先配置的陣列
+    pnl_profit, pnl_loss = np.empty_like(pnl_currency), np.empty_like(pnl_currency)
+    np.maximum(pnl_currency, 0, out=pnl_profit)
+    np.minimum(pnl_currency, 0, out=pnl_loss)
+    max_profit, max_loss = calculate_extremes(strategy_name, K, net_premium_points, multiplier, pnl_currency)
+    break_evens = calculate_break_evens(strategy_name, K, net_premium_points, S, pnl_currency)
+    margin = calculate_us_margin(strategy_name, K, net_premium_points, multiplier)
+    return S, pnl_currency, pnl_profit, pnl_loss, net_premium_points, max_profit, max_loss, break_evens, margin
+
+@st.cache_resource
+def _desc_html(name):
+    # 策略說明為靜態內容，每個策略只取一次
+    return STRATEGY_DESCRIPTIONS[name]
+
+@st.cache_resource(max_entries=64)
+def build_figure(strategy_name, legs, multiplier, cost_basis):
+    # 圖表只依數值輸入而定；與 compute_all 相同的快取鍵，切換說明等無關互動時直接沿用同一個圖表物件
+    # (cache_resource 不經 pickle 複製；st.plotly_chart 不會修改傳入的 figure)
+    S, pnl_currency, pnl_profit, pnl_loss, _, _, _, break_evens, _ = compute_all(strategy_name, legs, multiplier)
+    fig = go.Figure()
+
+    # 點位報酬率以 float32 customdata 送出；無成本基礎時不顯示此行
+    hovertemplate = (
+        "<b>股價 (Price):</b> %{x:$.2f}<br>" +
+        "<b>損益 (P/L):</b> %{y:$,.2f}"
+    )
+    if cost_basis > 0:
+        # cost_basis 為 np.float64，先轉成陣列的 dtype，避免 NumPy 2 型別提升把 customdata 變回 float64
+        custom_data = (pnl_currency * pnl_currency.dtype.type(100.0 / cost_basis))[:, None]
+        hovertemplate += "<br><b>點位報酬率 (Point ROI):</b> %{customdata[0]:.1f}%"
+    else:
+        custom_data = None
+    hovertemplate += "<extra></extra>"
+
+    fig.add_trace(go.Scattergl(
+        x=S, y=pnl_currency, customdata=custom_data, hovertemplate=hovertemplate,
+        mode='lines', name='策略損益 (P/L)', line=dict(color='royalblue', width=3)
+    ))
+
+    fig.add_hline(y=0, line_dash="dash", line_color="grey")
+
+    for be in break_evens:
+        fig.add_vline(x=be, line_dash="dash", line_color="purple", 
+                      annotation_text=f"BE: {be:.2f}",
+                      annotation_position="bottom right")
+
+    for k in sorted({k for _, k, _ in legs}):
+        fig.add_vline(x=k, line_dash="dot", line_color="red", 
+                      annotation_text=f"K={k}", 
+                      annotation_position="top left")
+
+    # CHANGED: 在填充區塊加入 hoverinfo='skip'
+    fig.add_trace(go.Scattergl(
+        x=S, y=pnl_profit, fill='tozeroy', 
+        fillcolor='rgba(0,176,80,0.2)', mode='none', name='獲利區',
+        hoverinfo='skip'  # 忽略此圖層的滑鼠事件
+    ))
+    fig.add_trace(go.Scattergl(
+        x=S, y=pnl_loss, fill='tozeroy', 
+        fillcolor='rgba(255,82,82,0.2)', mode='none', name='虧損區',
+        hoverinfo='skip'  # 忽略此圖層的滑鼠事件
+    ))
+
+    fig.update_layout(title=f'<b>{strategy_name} 到期損益圖 (單位: USD)</b>', xaxis_title='標的物到期價格', yaxis_title='損益 (Profit / Loss)', legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+    return fig
+
+# --- Streamlit UI 介面 ---
 st.set_page_config(layout="wide")
 st.title("📈 美股選擇權策略分析器 (US Options Strategy Analyzer)")
 st.write("此工具根據標準美股選擇權規則，視覺化策略的損益與分析所需資金。")
 
-# --- 側邊欄輸入 (無變動) ---
+# --- 側邊欄輸入 ---
 st.sidebar.header("⚙️ 參數設定")
 multiplier = st.sidebar.number_input("契約乘數 (Contract Multiplier)", value=100, help="美股選擇權的契約乘數固定為 100。")
 strategy_name = st.sidebar.selectbox(
@@ -53,11 +192,11 @@ strategy_name = st.sidebar.selectbox(
 )
 st.sidebar.markdown("---")
 with st.sidebar.expander(f"📖 查看「{strategy_name}」策略說明"):
-    st.markdown(STRATEGY_DESCRIPTIONS[strategy_name], unsafe_allow_html=True)
+    st.markdown(_desc_html(strategy_name), unsafe_allow_html=True)
 st.sidebar.markdown("---")
 
-# --- 參數輸入區塊 (無變動) ---
-strategy_details, strikes, error_message = [], [], ""
+# --- 參數輸入區塊 ---
+strategy_details, error_message = [], ""
 if strategy_name == "Bull Call Spread":
     st.sidebar.subheader("買權多頭價差 (看漲)")
     k_low = st.sidebar.number_input("買進買權履約價 (Long Call)", value=100.0, step=1.0)
@@ -66,7 +205,6 @@ if strategy_name == "Bull Call Spread":
     p_high = st.sidebar.number_input("權利金 (Premium)", value=0.80, step=0.01, format="%.2f")
     if k_low >= k_high: error_message = "邏輯錯誤：Long Call 的履約價必須低於 Short Call。"
     strategy_details = [{'type': 'long_call', 'strike': k_low, 'premium': p_low}, {'type': 'short_call', 'strike': k_high, 'premium': p_high}]
-    strikes = [k_low, k_high]
 
 elif strategy_name == "Bear Put Spread":
     st.sidebar.subheader("賣權空頭價差 (看跌)")
@@ -76,7 +214,6 @@ elif strategy_name == "Bear Put Spread":
     p_low = st.sidebar.number_input("權利金 (Premium)", value=1.20, step=0.01, format="%.2f")
     if k_low >= k_high: error_message = "邏輯錯誤：Long Put 的履約價必須高於 Short Put。"
     strategy_details = [{'type': 'long_put', 'strike': k_high, 'premium': p_high}, {'type': 'short_put', 'strike': k_low, 'premium': p_low}]
-    strikes = [k_low, k_high]
 
 elif strategy_name == "Bull Put Spread":
     st.sidebar.subheader("賣權牛市價差 (看漲)")
@@ -86,7 +223,6 @@ elif strategy_name == "Bull Put Spread":
     p_low = st.sidebar.number_input("權利金 (Premium)", value=1.20, step=0.01, format="%.2f")
     if k_low >= k_high: error_message = "邏輯錯誤：Short Put 的履約價必須高於 Long Put。"
     strategy_details = [{'type': 'short_put', 'strike': k_high, 'premium': p_high}, {'type': 'long_put', 'strike': k_low, 'premium': p_low}]
-    strikes = [k_low, k_high]
 
 elif strategy_name == "Bear Call Spread":
     st.sidebar.subheader("買權熊市價差 (看跌)")
@@ -96,7 +232,6 @@ elif strategy_name == "Bear Call Spread":
     p_high = st.sidebar.number_input("權利金 (Premium)", value=0.80, step=0.01, format="%.2f")
     if k_low >= k_high: error_message = "邏輯錯誤：Short Call 的履約價必須低於 Long Call。"
     strategy_details = [{'type': 'short_call', 'strike': k_low, 'premium': p_low}, {'type': 'long_call', 'strike': k_high, 'premium': p_high}]
-    strikes = [k_low, k_high]
 
 elif strategy_name == "Butterfly Spread":
     st.sidebar.subheader("蝶式價差 (買權)")
@@ -108,7 +243,6 @@ elif strategy_name == "Butterfly Spread":
     p_high = st.sidebar.number_input("權利金 (Premium)", value=0.50, step=0.01, format="%.2f")
     if not (k_low < k_mid < k_high): error_message = "邏輯錯誤：履約價必須是 Wing 1 < Body < Wing 2。"
     strategy_details = [{'type': 'long_call', 'strike': k_low, 'premium': p_low}, {'type': 'short_call', 'strike': k_mid, 'premium': p_mid}, {'type': 'short_call', 'strike': k_mid, 'premium': p_mid}, {'type': 'long_call', 'strike': k_high, 'premium': p_high}]
-    strikes = [k_low, k_mid, k_high]
 
 elif strategy_name == "Iron Condor":
     st.sidebar.subheader("鐵兀鷹")
@@ -122,7 +256,6 @@ elif strategy_name == "Iron Condor":
     p_lc = st.sidebar.number_input("權利金 (Premium)", value=0.60, step=0.01, format="%.2f")
     if not (k_lp < k_sp < k_sc < k_lc): error_message = "邏輯錯誤：履約價必須依序遞增。"
     strategy_details = [{'type': 'long_put', 'strike': k_lp, 'premium': p_lp}, {'type': 'short_put', 'strike': k_sp, 'premium': p_sp}, {'type': 'short_call', 'strike': k_sc, 'premium': p_sc}, {'type': 'long_call', 'strike': k_lc, 'premium': p_lc}]
-    strikes = [k_lp, k_sp, k_sc, k_lc]
 
 
 # --- 主面板顯示區塊 ---
@@ -130,15 +263,9 @@ if error_message:
     st.error(f"**輸入錯誤：** {error_message}", icon="🚨")
     st.warning("請修正左側側邊欄的履約價以繼續分析。")
 elif strategy_details:
-    min_strike, max_strike = min(strikes), max(strikes)
-    buffer = (max_strike - min_strike) * 1.5 if max_strike > min_strike else 20
-    S = np.arange(min_strike - buffer, max_strike + buffer, 0.5)
-    net_premium_points = sum([leg['premium'] if leg['type'].startswith('short') else -leg['premium'] for leg in strategy_details])
-    pnl_currency = (calculate_payoff(S, strategy_details) + net_premium_points) * multiplier
-    max_profit, max_loss = np.max(pnl_currency), np.min(pnl_currency)
-    break_evens = find_break_even_points(S, pnl_currency)
+    legs = tuple((leg['type'], leg['strike'], leg['premium']) for leg in strategy_details)
+    S, pnl_currency, pnl_profit, pnl_loss, net_premium_points, max_profit, max_loss, break_evens, margin = compute_all(strategy_name, legs, multiplier)
     net_cost_credit = net_premium_points * multiplier
-    margin = calculate_us_margin(strategy_name, strategy_details, multiplier)
     
     cost_basis = 0
     if net_cost_credit < 0:
@@ -148,11 +275,6 @@ elif strategy_details:
         cost_basis = margin
         roi_help_text = "權利金淨收入 / 所需保證金"
     
-    if cost_basis > 0:
-        roi_per_point = (pnl_currency / cost_basis) * 100
-    else:
-        roi_per_point = np.full_like(pnl_currency, np.nan) 
-    
     if net_cost_credit < 0:
         total_roi = (max_profit / cost_basis) * 100 if cost_basis > 0 else float('inf')
     else:
@@ -169,54 +291,15 @@ elif strategy_details:
     st.metric("整體報酬率 (Overall ROI)", f"{total_roi:.1f}%", help=roi_help_text)
     st.write(f"**損益兩平點 (Break-even):** {', '.join([f'{be:.2f}' for be in break_evens]) if break_evens else 'N/A'}")
     
-    fig = go.Figure()
-
-    custom_data = np.stack((roi_per_point,), axis=-1)
-    hovertemplate = (
-        "<b>股價 (Price):</b> %{x:$.2f}<br>" +
-        "<b>損益 (P/L):</b> %{y:$,.2f}<br>" +
-        "<b>點位報酬率 (Point ROI):</b> %{customdata[0]:.1f}%" +
-        "<extra></extra>"
-    )
-    
-    fig.add_trace(go.Scatter(
-        x=S, y=pnl_currency, customdata=custom_data, hovertemplate=hovertemplate,
-        mode='lines', name='策略損益 (P/L)', line=dict(color='royalblue', width=3)
-    ))
-    
-    fig.add_hline(y=0, line_dash="dash", line_color="grey")
-
-    for be in break_evens:
-        fig.add_vline(x=be, line_dash="dash", line_color="purple", 
-                      annotation_text=f"BE: {be:.2f}",
-                      annotation_position="bottom right")
-
-    for k in set(strikes):
-        fig.add_vline(x=k, line_dash="dot", line_color="red", 
-                      annotation_text=f"K={k}", 
-                      annotation_position="top left")
-    
-    # CHANGED: 在填充區塊加入 hoverinfo='skip'
-    fig.add_trace(go.Scatter(
-        x=S, y=pnl_currency.clip(min=0), fill='tozeroy', 
-        fillcolor='rgba(0,176,80,0.2)', mode='none', name='獲利區',
-        hoverinfo='skip'  # 忽略此圖層的滑鼠事件
-    ))
-    fig.add_trace(go.Scatter(
-        x=S, y=pnl_currency.clip(max=0), fill='tozeroy', 
-        fillcolor='rgba(255,82,82,0.2)', mode='none', name='虧損區',
-        hoverinfo='skip'  # 忽略此圖層的滑鼠事件
-    ))
-    
-    fig.update_layout(title=f'<b>{strategy_name} 到期損益圖 (單位: USD)</b>', xaxis_title='標的物到期價格', yaxis_title='損益 (Profit / Loss)', legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
-    
+    fig = build_figure(strategy_name, legs, multiplier, cost_basis)
     st.plotly_chart(fig, use_container_width=True)
 
     st.subheader("策略組成")
-    for leg in strategy_details:
-        leg_type_map = {'long_call': '買進 買權', 'short_call': '賣出 買權', 'long_put': '買進 賣權', 'short_put': '賣出 賣權'}
-        action_text = f"{leg_type_map[leg['type']]} @ 履約價 ${leg['strike']:.2f}, 權利金 ${leg['premium']:.2f}"
-        st.markdown(f"- {action_text}")
+    # 所有腳位合併為一次 markdown 呼叫送出
+    st.markdown("\n".join(
+        f"- {LEG_TYPE_MAP[leg['type']]} @ 履約價 ${leg['strike']:.2f}, 權利金 ${leg['premium']:.2f}"
+        for leg in strategy_details
+    ))
 else:
     st.info("請在左方選擇一個策略開始分析。")
 